@@ -7,16 +7,25 @@ python download_files.py 'https://example.com/data_{1..5}.csv'
 python download_files.py
 с указанием параметров в файле config.yaml
 """
+import os
 import re
+import errno
+import random
+import contextlib
 import logging
 import sys
 from pathlib import Path
-from typing import List, Dict, Any
+from urllib.parse import urlparse, unquote
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Deque, Tuple, Set, BinaryIO, Callable, Iterator
 import asyncio
 import aiohttp
-import aiofiles
 import yaml
-from tenacity import retry, stop_after_attempt, wait_fixed
+try:
+    import uvloop  # быстрый цикл событий на libuv; под Windows недоступен
+except ImportError:
+    uvloop = None
 #from tqdm.asyncio import tqdm  # tqdm поддерживает asyncio напрямую
 from rich.console import Console
 from rich.live import Live
@@ -37,10 +46,60 @@ from rich.table import Table
 
 console = Console()
 
-# Глобальные списки для отслеживания состояния
-completed_files = []
-failed_files = []  # хранит кортежи (filename, error_message)
-active_tasks: dict[int, str] = {}  # task_id -> filename
+# Диапазон в шаблоне URL: {start..end}
+_WILDCARD_RE = re.compile(r'\{(\d+)\.\.(\d+)\}')
+
+# Символы, недопустимые в именах файлов (Windows)
+_UNSAFE_NAME_RE = re.compile(r'[\\/:*?"<>|]')
+
+# Размер чтения из сети по умолчанию; крупнее — меньше итераций и записей на файл
+DEFAULT_CHUNK_SIZE = 256 << 10
+
+# Размер буфера записи на диск
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Сколько прочитанных из сети кусков может ждать записи на диск
+WRITE_QUEUE_SIZE = 8
+
+# Файлы не больше этого размера читаются в память целиком, а не потоком
+WHOLE_READ_LIMIT = 8 << 20
+
+# Минимальный размер куска при параллельной загрузке одного файла
+PARALLEL_MIN_PART = 4 << 20
+
+# Минимальный интервал (сек) между обновлениями прогресса файла
+PROGRESS_INTERVAL = 0.05
+
+# Повторы: верхняя граница задержки (сек) и доля случайного разброса
+RETRY_MAX_DELAY = 30.0
+RETRY_JITTER = 0.5
+
+# Сколько последних завершённых файлов и ошибок показывать
+COMPLETED_SHOWN = 20
+FAILED_SHOWN = 10
+
+
+@dataclass
+class BatchState:
+    """Состояние одного запуска download_all: хранит только то, что показывается"""
+    completed: Deque[str] = field(default_factory=lambda: deque(maxlen=COMPLETED_SHOWN))
+    failed: Deque[Tuple[str, str]] = field(  # (filename, error_message)
+        default_factory=lambda: deque(maxlen=FAILED_SHOWN)
+    )
+    active: Dict[TaskID, str] = field(default_factory=dict)  # task_id -> filename
+    completed_count: int = 0
+    failed_count: int = 0
+    skipped_count: int = 0  # уже загруженные ранее, в сеть за ними не ходили
+
+    def add_completed(self, filename: str) -> None:
+        """Отмечает файл как успешно загруженный"""
+        self.completed.append(filename)
+        self.completed_count += 1
+
+    def add_failed(self, filename: str, error_msg: str) -> None:
+        """Отмечает файл как загруженный с ошибкой"""
+        self.failed.append((filename, error_msg))
+        self.failed_count += 1
 
 
 def setup_logging(config: Dict[str, Any]) -> None:
@@ -57,12 +116,13 @@ def setup_logging(config: Dict[str, Any]) -> None:
     )
 
 
-def expand_wildcard_url(template: str) -> List[str]:
+def expand_wildcard_url(template: str) -> Iterator[str]:
     """
     Преобразует 'https://ex.com/file_{1..3}.csv' →
-    ['https://ex.com/file_1.csv', ..., 'https://ex.com/file_3.csv']
+    'https://ex.com/file_1.csv', ..., 'https://ex.com/file_3.csv'.
+    Шаблон проверяется сразу, а URL строятся лениво, по мере перебора
     """
-    match = re.search(r'\{(\d+)\.\.(\d+)\}', template)
+    match = _WILDCARD_RE.search(template)
     if not match:
         raise ValueError("Шаблон должен содержать {start..end}, например {1..10}")
 
@@ -73,121 +133,446 @@ def expand_wildcard_url(template: str) -> List[str]:
 
     # Определяем ширину формата (для ведущих нулей)
     width = len(start_str) if start_str.startswith('0') and len(start_str) > 1 else 0
-    urls = []
-    for i in range(start, end + 1):
-        repl = str(i).zfill(width) if width else str(i)
-        url = template[:match.start()] + repl + template[match.end():]
-        urls.append(url)
-    return urls
+    # Один шаблон для str.format; фигурные скобки вне диапазона экранируем
+    prefix, suffix = (
+        part.replace('{', '{{').replace('}', '}}')
+        for part in (template[:match.start()], template[match.end():])
+    )
+    fmt = prefix + (f"{{:0{width}d}}" if width else "{}") + suffix
+    return map(fmt.format, range(start, end + 1))
 
 
-async def download_file(
+def url_filename(url: str, with_query: bool = False) -> str:
+    """
+    Имя файла из пути URL с раскодированными %XX.
+    Query-строка добавляется перед расширением только при with_query,
+    символы, недопустимые в именах файлов, заменяются на '_'
+    """
+    parsed = urlparse(url)
+    name = unquote(parsed.path.rsplit('/', 1)[-1])
+    if with_query and parsed.query:
+        stem, ext = os.path.splitext(name)
+        name = f"{stem}_{_UNSAFE_NAME_RE.sub('_', unquote(parsed.query))}{ext}"
+    return name
+
+
+def names_may_collide(template: str) -> bool:
+    """
+    Могут ли разные URL шаблона дать одно имя файла: только если диапазон
+    {start..end} стоит вне последнего сегмента пути (в каталоге или query-строке)
+    """
+    match = _WILDCARD_RE.search(template)
+    # Диапазон заменяем символом, которого не бывает в URL, и ищем его в имени
+    path = urlparse(template[:match.start()] + '\0' + template[match.end():]).path
+    return '\0' not in path.rsplit('/', 1)[-1]
+
+
+def claim_path(claimed: Optional[Set[str]], output_path: Path, url: str) -> Optional[Path]:
+    """
+    Путь для url в output_path с именем, ещё не занятым другим URL: сначала имя
+    из пути, при совпадении — имя с query-строкой. None, если заняты оба:
+    два задания никогда не пишут в один файл.
+    claimed — выданные имена; None, если имена шаблона совпасть не могут
+    """
+    if claimed is None:
+        return output_path / url_filename(url)
+    for name in (url_filename(url), url_filename(url, with_query=True)):
+        if name not in claimed:
+            claimed.add(name)
+            return output_path / name
+    return None
+
+
+def file_size(path: Path) -> int:
+    """Размер файла в байтах или 0, если файла нет (один вызов stat)"""
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def get_part_path(filepath: Path) -> Path:
+    """Путь временного файла, в который идёт загрузка"""
+    return filepath.with_name(f"{filepath.name}.part")
+
+
+def get_meta_path(filepath: Path) -> Path:
+    """Путь метафайла, которым GUI помечает незавершённую загрузку"""
+    return filepath.parent / f".{filepath.name}.meta"
+
+
+def is_downloaded(filepath: Path) -> bool:
+    """
+    Файл уже загружен: существует, не пуст и рядом нет метафайла
+    (файл с метафайлом прежние версии GUI писали на месте, он может быть недокачан)
+    """
+    return file_size(filepath) > 0 and not get_meta_path(filepath).exists()
+
+
+def finish_download(filepath: Path) -> None:
+    """Переносит загруженный .part на место итогового файла и удаляет метафайл"""
+    get_part_path(filepath).replace(filepath)
+    get_meta_path(filepath).unlink(missing_ok=True)
+
+
+def preallocate(fd: int, size: int) -> None:
+    """
+    Резервирует место под файл целиком, чтобы ФС выделила его одним куском.
+    Где posix_fallocate недоступен, файл просто увеличивается до нужного размера.
+    """
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+    os.ftruncate(fd, size)
+
+
+def split_ranges(start: int, end: int, parts: int) -> List[Tuple[int, int]]:
+    """Делит байты [start, end) на parts почти равных полуинтервалов"""
+    step, rest = divmod(end - start, parts)
+    bounds = []
+    for i in range(parts):
+        size = step + (1 if i < rest else 0)
+        bounds.append((start, start + size))
+        start += size
+    return bounds
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Временная ошибка, которую имеет смысл повторить: сеть, таймаут, 5xx/429"""
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status >= 500 or exc.status == 429
+    return isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def retry_delay(delay: float, attempt: int) -> float:
+    """Экспоненциальная задержка перед повтором со случайным разбросом (jitter)"""
+    backoff = delay * (2 ** attempt) * (1 + random.random() * RETRY_JITTER)
+    return min(RETRY_MAX_DELAY, backoff)
+
+
+async def _fetch_to_file(
     session: aiohttp.ClientSession,
     url: str,
-    output_dir: Path,
-    semaphore: asyncio.Semaphore,
+    filepath: Path,
     chunk_size: int,
-    retries_enabled: bool,
-    max_attempts: int,
-    delay: float,
     progress: Progress,
     task_id: TaskID,
-    filename: str,
+    resume: bool,
+    parallel_parts: int = 1,
 ):
-    """Скачивает один файл с ограничением параллелизма"""
-    global completed_files, failed_files, active_tasks
-    async with semaphore:  # ограничиваем одновременные запросы
-        try:
-            filepath = output_dir / filename
-
-                async def _download():
-                    async with session.get(url) as resp:
-                    if resp.status == 200:
-                        # Получаем общий размер, если есть
-                        total = resp.content_length or 1
-                        if total is None or total == 0:
-                            # Можно создать задачу без total → будет неопределённый прогресс
-                            # BarColumn не заполнится — это нормально
-                            progress.start_task(task_id)
-                        else:
-                            progress.update(task_id, total=total, visible=True)
-
-                        async with aiofiles.open(filepath, 'wb') as f:
-                            async for chunk in resp.content.iter_chunked(chunk_size):
-                                await f.write(chunk)
-                                progress.update(task_id, advance=len(chunk))
-                        completed_files.append(filename)
-                        logging.info("✅ Успешно: %s → %s",url ,filepath)
-                    else:
-                        raise aiohttp.ClientResponseError(
-                            request_info=resp.request_info,
-                            history=resp.history,
-                            status=resp.status,
-                            message=f"HTTP {resp.status}",
-                            headers=resp.headers
-                        )
-
-            if retries_enabled:
-                # Патчим retry-декоратор под текущие настройки
-                @retry(
-                    stop=stop_after_attempt(max_attempts),
-                    wait=wait_fixed(delay),
-                    reraise=True
+    """
+    Одна попытка загрузки файла.
+    Данные пишутся во временный .part-файл, который переименовывается
+    в filepath только после успешной загрузки. При resume недокачанный
+    .part продолжается запросом Range.
+    При parallel_parts > 1 большой файл качается несколькими Range-запросами сразу.
+    """
+    server_size = None
+    accepts_ranges = False
+    if parallel_parts > 1:
+        async with session.head(url) as head_resp:
+            if head_resp.status == 200:
+                server_size = head_resp.content_length
+                accepts_ranges = 'bytes' in head_resp.headers.get('Accept-Ranges', '').lower()
+
+    part_path = get_part_path(filepath)
+    # Операции с ФС — в пуле потоков: на сетевых дисках они могут подвисать
+    existing = await asyncio.to_thread(file_size, part_path) if resume else 0
+
+    if accepts_ranges and server_size and hasattr(os, "pwrite"):
+        parts = min(parallel_parts, (server_size - existing) // PARALLEL_MIN_PART)
+        if parts > 1:
+            progress.update(task_id, total=server_size, completed=existing, visible=True)
+            await _fetch_parallel(
+                session, url, part_path, existing, server_size, parts,
+                chunk_size, progress, task_id
+            )
+            await asyncio.to_thread(finish_download, filepath)
+            return
+
+    headers = {'Range': f'bytes={existing}-'} if existing else {}
+
+    # chunk_size задаёт размер буфера чтения сокета; данные забираем по мере поступления
+    async with session.get(url, headers=headers, read_bufsize=chunk_size) as resp:
+        if resp.status == 416 and headers:
+            # .part не меньше файла на сервере (например, процесс был убит
+            # после предвыделения места) — продолжать нечего
+            restart = True
+        else:
+            restart = False
+            await _write_response(resp, part_path, existing if headers else 0, progress, task_id)
+    if restart:
+        await asyncio.to_thread(part_path.unlink, missing_ok=True)
+        await _fetch_to_file(
+            session, url, filepath, chunk_size, progress, task_id,
+            resume=False, parallel_parts=parallel_parts
+        )
+        return
+    await asyncio.to_thread(finish_download, filepath)
+
+
+async def _fetch_parallel(
+    session: aiohttp.ClientSession,
+    url: str,
+    part_path: Path,
+    start: int,
+    total: int,
+    parts: int,
+    chunk_size: int,
+    progress: Progress,
+    task_id: TaskID,
+):
+    """
+    Загружает байты [start, total) файла parts параллельными Range-запросами,
+    записывая каждый кусок по своему смещению через os.pwrite
+    """
+    bounds = split_ranges(start, total, parts)
+    done = [0] * parts
+    loop = asyncio.get_running_loop()
+    last_emit = loop.time()
+    fd = os.open(part_path, os.O_WRONLY | os.O_CREAT, 0o644)
+
+    async def fetch_range(i: int, first: int, end: int):
+        nonlocal last_emit
+        headers = {'Range': f'bytes={first}-{end - 1}'}
+        async with session.get(url, headers=headers, read_bufsize=chunk_size) as resp:
+            if resp.status != 206:
+                raise aiohttp.ClientResponseError(
+                    request_info=resp.request_info,
+                    history=resp.history,
+                    status=resp.status,
+                    message=f"HTTP {resp.status} (ожидался 206)",
+                    headers=resp.headers
                 )
-                async def _retrying_download():
-                    await _download()
+            offset = first
+            async for chunk in resp.content.iter_any():
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+                done[i] += len(chunk)
+                now = loop.time()
+                if now - last_emit >= PROGRESS_INTERVAL:
+                    progress.update(task_id, completed=start + sum(done))
+                    last_emit = now
 
-                await _retrying_download()
+    try:
+        preallocate(fd, total)
+        tasks = [
+            asyncio.ensure_future(fetch_range(i, first, end))
+            for i, (first, end) in enumerate(bounds)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        # Оставляем только непрерывно загруженное начало файла — с него можно продолжить
+        received = start
+        for (first, end), size in zip(bounds, done):
+            received = first + size
+            if received < end:
+                break
+        os.ftruncate(fd, received)
+        os.close(fd)
+    progress.update(task_id, completed=total)
+
+
+async def _write_response(
+    resp: aiohttp.ClientResponse,
+    part_path: Path,
+    offset: int,
+    progress: Progress,
+    task_id: TaskID,
+):
+    """Пишет тело ответа в part_path, продолжая с offset, если сервер вернул 206"""
+    if resp.status == 206 and offset:
+        downloaded = offset
+    elif resp.status == 200:
+        # Range не запрашивался или сервер его проигнорировал — качаем заново
+        downloaded = 0
+    else:
+        raise aiohttp.ClientResponseError(
+            request_info=resp.request_info,
+            history=resp.history,
+            status=resp.status,
+            message=f"HTTP {resp.status}",
+            headers=resp.headers
+        )
+    # Без Content-Length total остаётся None → неопределённый прогресс
+    total = downloaded + resp.content_length if resp.content_length else None
+    progress.update(task_id, total=total, completed=downloaded, visible=True)
+
+    # Обычный буферизованный файл: запись идёт в буфер 1 МиБ
+    loop = asyncio.get_running_loop()
+    last_emit = loop.time()
+
+    def on_written(size: int):
+        nonlocal downloaded, last_emit
+        downloaded += size
+        # Прогресс обновляем не чаще PROGRESS_INTERVAL, перерисовкой занимается Live
+        now = loop.time()
+        if now - last_emit >= PROGRESS_INTERVAL:
+            progress.update(task_id, completed=downloaded)
+            last_emit = now
+
+    with open(part_path, 'r+b' if downloaded else 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        try:
+            if total and resp.content_length <= WHOLE_READ_LIMIT:
+                # Небольшой файл известного размера: читаем целиком и пишем одним вызовом
+                f.seek(downloaded)
+                data = await resp.read()
+                f.write(data)
+                downloaded += len(data)
             else:
-                await _download()
-        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
-            error_msg = str(e)[:80]  # укоротим длинные ошибки
-            failed_files.append((filename, error_msg))
-            logging.error("❌ Ошибка при загрузке %s: %s", url, e)
+                if total:
+                    preallocate(f.fileno(), total)
+                f.seek(downloaded)
+                await _stream_to_file(resp.content, f, on_written)
         finally:
-            # Удаляем из активных
-            if task_id in active_tasks:
-                del active_tasks[task_id]
+            # Отрезаем незаполненный хвост предвыделенного места, чтобы
+            # размер .part всегда означал число реально полученных байт
+            f.truncate(downloaded)
+    progress.update(task_id, completed=downloaded)
 
-    progress.update(task_id, visible=False)
-    return True  # важно для as_completed
+
+async def _stream_to_file(
+    content: aiohttp.StreamReader,
+    f: BinaryIO,
+    on_written: Callable[[int], None],
+):
+    """
+    Переносит поток ответа в файл. Чтение сети и запись на диск разделены
+    ограниченной очередью: пишущая корутина склеивает накопившиеся куски
+    и отдаёт их в пул потоков одной записью, а сеть тем временем читается дальше.
+    on_written вызывается с числом байт после каждой успешной записи.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+    loop = asyncio.get_running_loop()
+    write_errors: List[OSError] = []
+
+    async def writer():
+        finished = False
+        while not finished:
+            parts = [await queue.get()]
+            while not queue.empty():
+                parts.append(queue.get_nowait())
+            if parts[-1] is None:  # признак конца потока
+                parts.pop()
+                finished = True
+            # После ошибки записи просто вычерпываем очередь, чтобы читатель не завис
+            if parts and not write_errors:
+                data = b"".join(parts)
+                try:
+                    await loop.run_in_executor(None, f.write, data)
+                except OSError as e:
+                    write_errors.append(e)
+                else:
+                    on_written(len(data))
+
+    writer_task = asyncio.ensure_future(writer())
+    try:
+        async for chunk in content.iter_any():
+            if write_errors:
+                break
+            await queue.put(chunk)
+    finally:
+        # Дожидаемся записи всего, что уже в очереди: только после этого
+        # файл можно обрезать и закрыть
+        await queue.put(None)
+        await writer_task
+    if write_errors:
+        raise write_errors[0]
 
 
-def make_status_display(progress: Progress) -> Table:
+async def download_file(
+    session: aiohttp.ClientSession,
+    url: str,
+    filepath: Path,
+    chunk_size: int,
+    retries_enabled: bool,
+    max_attempts: int,
+    delay: float,
+    progress: Progress,
+    state: BatchState,
+    resume: bool = True,
+    parallel_parts: int = 1,
+):
+    """
+    Скачивает один файл (параллелизм ограничивается числом воркеров в download_all).
+    Строка прогресса заводится только сейчас и остаётся скрытой до ответа сервера.
+    """
+    filename = filepath.name
+    task_id = progress.add_task("download", filename=filename, total=None, visible=False)
+    state.active[task_id] = filename
+    try:
+        attempts = max(1, max_attempts) if retries_enabled else 1
+        for attempt in range(attempts):
+            try:
+                await _fetch_to_file(
+                    session, url, filepath, chunk_size, progress, task_id,
+                    resume, parallel_parts
+                )
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # 4xx и исчерпанные попытки — сразу в ошибки
+                if attempt + 1 >= attempts or not is_transient_error(e):
+                    raise
+                logging.warning("🔁 Повтор %s (%d/%d): %s", url, attempt + 1, attempts, e)
+                progress.update(task_id, completed=0)
+                await asyncio.sleep(retry_delay(delay, attempt))
+        state.add_completed(filename)
+        logging.info("✅ Успешно: %s → %s", url, filepath)
+    except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+        error_msg = str(e)[:80]  # укоротим длинные ошибки
+        state.add_failed(filename, error_msg)
+        logging.error("❌ Ошибка при загрузке %s: %s", url, e)
+    finally:
+        # Удаляем из активных; строка прогресса больше не нужна — не копим задачи в Progress
+        state.active.pop(task_id, None)
+        progress.remove_task(task_id)
+
+
+def make_status_display(progress: Progress, state: BatchState) -> Table:
     """Создаёт таблицу с тремя секциями: активные, завершённые, ошибки"""
     table = Table.grid(expand=True)
     table.add_column(ratio=1)
 
     # Активные задачи — используем сам объект Progress
-    if active_tasks:
+    if state.active:
         table.add_row(Panel(
             progress,
-            title=f"📥 В процессе: {len(active_tasks)}.",
+            title=f"📥 В процессе: {len(state.active)}.",
             border_style="blue"
         ))
     else:
         table.add_row(Text("📥 В процессе: 0.", style="blue"))
 
     # Завершённые
-    if completed_files:
-        completed_text = Text("\n".join(f"• {f}"
-        for f in sorted(completed_files[-20:])))  # последние 20
-        add_comment = 'Показаны последние 20' if len(completed_files)>=20 else ''
+    skipped_note = (f" Пропущено как уже загруженные: {state.skipped_count}."
+                    if state.skipped_count else "")
+    if state.completed:
+        completed_text = Text("\n".join(f"• {f}" for f in state.completed))
+        add_comment = (f'Показаны последние {COMPLETED_SHOWN}'
+                       if state.completed_count >= COMPLETED_SHOWN else '')
         table.add_row(Panel(
             completed_text,
-            title=f"✅ Завершено: {len(completed_files)}. {add_comment}",
+            title=f"✅ Завершено: {state.completed_count}.{skipped_note} {add_comment}",
             border_style="green"
         ))
     else:
-        table.add_row(Text("✅ Завершено: 0.", style="green"))
+        table.add_row(Text(f"✅ Завершено: 0.{skipped_note}", style="green"))
 
     # Ошибки
-    if failed_files:
-        failed_text = Text("\n".join(f"• {f} → {err}"
-        for f, err in failed_files[-10:]))  # последние 10
+    if state.failed:
+        failed_text = Text("\n".join(f"• {f} → {err}" for f, err in state.failed))
         table.add_row(Panel(
             failed_text,
-            title=f"❌ Ошибки: {len(failed_files)}.",
+            title=f"❌ Ошибки: {state.failed_count}.",
             border_style="red"
         ))
     else:
@@ -196,26 +581,74 @@ def make_status_display(progress: Progress) -> Table:
     return table
 
 
-async def download_all(config: Dict[str, Any]):
-    """Основная функция загрузки"""
-    global completed_files, failed_files, active_tasks
-    completed_files.clear()
-    failed_files.clear()
-    active_tasks.clear()
-
-    dl_cfg = config["download"]
-    http_cfg = config["http"]
-    urls = expand_wildcard_url(dl_cfg["url_template"])
-    output_path = Path(dl_cfg["output_dir"])
-    output_path.mkdir(parents=True, exist_ok=True)
-
+def create_session(http_cfg: Dict[str, Any], max_concurrent: int) -> aiohttp.ClientSession:
+    """Создаёт HTTP-сессию с пулом на max_concurrent одновременных соединений к хосту"""
     timeout = aiohttp.ClientTimeout(
         total=http_cfg["timeout"]["total"],
         connect=http_cfg["timeout"]["connect"]
     )
+    # Пул соединений: переиспользуем TCP/TLS-соединения к одному хосту
+    connector = aiohttp.TCPConnector(
+        limit=max_concurrent * 2,
+        limit_per_host=max_concurrent,
+        keepalive_timeout=75,
+        ttl_dns_cache=300,
+    )
+    # Файлы нужны байт в байт: сжатие не запрашиваем и не распаковываем,
+    # иначе Range-смещения при докачке относились бы к сжатому потоку
+    return aiohttp.ClientSession(
+        timeout=timeout,
+        connector=connector,
+        headers={'Accept-Encoding': 'identity'},
+        auto_decompress=False,
+        read_bufsize=DEFAULT_CHUNK_SIZE,
+    )
 
-    semaphore = asyncio.Semaphore(dl_cfg.get("max_concurrent", 10))
-    chunk_size = dl_cfg.get("chunk_size", 8192)
+
+async def download_all(
+    config: Dict[str, Any],
+    session: Optional[aiohttp.ClientSession] = None,
+) -> BatchState:
+    """
+    Основная функция загрузки. Возвращает итоговое состояние запуска.
+    Если передана session, она используется повторно и не закрывается —
+    так несколько запусков подряд работают с уже открытыми соединениями.
+    """
+    state = BatchState()
+
+    dl_cfg = config["download"]
+    http_cfg = config["http"]
+    urls = expand_wildcard_url(dl_cfg["url_template"])
+    output_path = Path(dl_cfg["output_dir"])
+    await asyncio.to_thread(output_path.mkdir, parents=True, exist_ok=True)
+    resume = dl_cfg.get("resume", True)
+    # Пути назначения считаем один раз для всего списка. Повторяющиеся URL
+    # отбрасываем; разным URL с одинаковым именем файла выдаются разные пути,
+    # а если развести их не удалось — задание сразу уходит в ошибки.
+    # Имена отслеживаются, только если шаблон вообще допускает совпадения
+    claimed: Optional[Set[str]] = set() if names_may_collide(dl_cfg["url_template"]) else None
+    jobs = []
+    for url in dict.fromkeys(urls):
+        filepath = claim_path(claimed, output_path, url)
+        if filepath is None:
+            state.add_failed(url_filename(url), "Имя файла совпадает с другим URL")
+            logging.error("❌ Имя файла для %s совпадает с другим URL, пропущено", url)
+            continue
+        jobs.append((url, filepath))
+    if resume:
+        # Готовые файлы появляются только после успешной загрузки (через .part,
+        # так же пишет и GUI), поэтому для их пропуска запросы к серверу не нужны
+        pending = await asyncio.to_thread(
+            lambda: [(url, fp) for url, fp in jobs if not is_downloaded(fp)]
+        )
+        state.skipped_count = len(jobs) - len(pending)
+        if state.skipped_count:
+            logging.info("⏭️ Уже загружено ранее, пропущено: %d", state.skipped_count)
+        jobs = pending
+
+    max_concurrent = dl_cfg.get("max_concurrent", 10)
+    chunk_size = dl_cfg.get("chunk_size", DEFAULT_CHUNK_SIZE)
+    parallel_parts = max(1, dl_cfg.get("parallel_parts", 1))
 
     retry_cfg = http_cfg.get("retries", {})
     retries_enabled = retry_cfg.get("enabled", False)
@@ -245,28 +678,33 @@ async def download_all(config: Dict[str, Any]):
         # auto_refresh=False  # обновляем вручную через Live
     )
 
-    # Инициализируем Live-рендер
-    with Live(make_status_display(progress), refresh_per_second=10, console=console) as live:
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            tasks: List[asyncio.Task[Any]] = []
-            for url in urls:
-                filename = url.split('/')[-1]
-                task_id = progress.add_task("download", filename=filename, visible=False)
-                active_tasks[task_id] = filename
-                coro = download_file(
-                    session, url, output_path, semaphore, chunk_size,
-                    retries_enabled, max_attempts, delay,
-                    progress, task_id, filename
-                )
-                tasks.append(asyncio.create_task(coro))
-                # Обновляем отображение после добавления задачи
-                live.update(make_status_display(progress))
+    # Инициализируем Live-рендер: таблица пересобирается при каждой автоперерисовке,
+    # поэтому вручную вызывать live.update() не нужно
+    with Live(
+        get_renderable=lambda: make_status_display(progress, state),
+        refresh_per_second=10,
+        console=console,
+    ):
+        if session is None:
+            session_cm = create_session(http_cfg, max_concurrent * parallel_parts)
+        else:
+            session_cm = contextlib.nullcontext(session)  # сессией владеет вызывающий код
+        async with session_cm as session:
+            # Воркеры разбирают URL из общего итератора по мере освобождения:
+            # одновременно существует не более max_concurrent задач и строк прогресса
+            job_iter = iter(jobs)
+
+            async def worker():
+                for url, filepath in job_iter:
+                    await download_file(
+                        session, url, filepath, chunk_size,
+                        retries_enabled, max_attempts, delay,
+                        progress, state, resume, parallel_parts
+                    )
+
+            await asyncio.gather(*(worker() for _ in range(min(max_concurrent, len(jobs)))))
 
-            # Ждём завершения всех задач
-            # ❗ ВАЖНО: не используем gather, а обрабатываем по одной
-            for completed_task in asyncio.as_completed(tasks):
-                await completed_task  # ждём завершения одной задачи
-                live.update(make_status_display(progress))  # ← обновляем интерфейс
+    return state
 
 
 def load_config(path: str = "config.yaml") -> Dict[str, Any]:
@@ -291,7 +729,8 @@ def main(argv=None):
     config = load_config(config_path)
     setup_logging(config.get("logging", {}))
     try:
-        asyncio.run(download_all(config))
+        run = uvloop.run if uvloop is not None else asyncio.run
+        run(download_all(config))
         logging.info("✅ Все файлы загружены!")
     except KeyboardInterrupt:
         logging.warning("⚠️ Загрузка прервана пользователем (Ctrl+C)")
@@ -1,10 +1,42 @@
+import os
+import errno
 import asyncio
 import aiohttp
-import aiofiles
 import re
-import json
+from itertools import chain, islice
 from pathlib import Path
-from typing import List, Callable
+from urllib.parse import urlparse, unquote
+from typing import List, Tuple, Set, Callable, Iterator, Optional
+
+# Диапазон в шаблоне URL: {start..end}
+_WILDCARD_RE = re.compile(r'\{(\d+)\.\.(\d+)\}')
+
+# Символы, недопустимые в именах файлов (Windows)
+_UNSAFE_NAME_RE = re.compile(r'[\\/:*?"<>|]')
+
+# Верхняя граница числа одновременных загрузок; под неё рассчитан пул соединений
+MAX_CONCURRENT = 32
+
+# Сколько файлов может передаваться одновременно на один поток: поток занят
+# только на время установки соединения, передачу тел ограничивает второй,
+# больший предел
+TRANSFERS_PER_SLOT = 2
+
+# Размер чтения из сети по умолчанию; крупнее — меньше итераций и записей на файл
+DEFAULT_CHUNK_SIZE = 256 << 10
+
+# Размер буфера записи на диск
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Прогресс сообщается не чаще, чем раз в столько байт или секунд:
+# каждый вызов on_progress — это сигнал в поток GUI
+PROGRESS_EMIT_BYTES = 256 << 10
+PROGRESS_EMIT_INTERVAL = 0.1
+
+# Файлы от этого размера качаются несколькими Range-запросами параллельно,
+# если файлов в пакете меньше, чем потоков; каждый кусок — не меньше PARALLEL_MIN_PART
+PARALLEL_MIN_SIZE = 16 << 20
+PARALLEL_MIN_PART = 4 << 20
 
 
 class DownloadCancelled(Exception):
@@ -12,134 +44,363 @@ class DownloadCancelled(Exception):
     pass
 
 
-def expand_wildcard_url(template: str) -> List[str]:
-    match = re.search(r'\{(\d+)\.\.(\d+)\}', template)
+class AdjustableConcurrency:
+    """
+    Ограничитель числа одновременных загрузок, предел которого можно менять
+    прямо во время работы (значение asyncio.Semaphore после создания не меняется)
+    """
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._active = 0
+        self._cond = asyncio.Condition()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    async def acquire(self):
+        async with self._cond:
+            while self._active >= self._limit:
+                await self._cond.wait()
+            self._active += 1
+
+    async def release(self):
+        async with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    async def set_limit(self, limit: int):
+        """Меняет предел; при увеличении ожидающие загрузки стартуют сразу"""
+        async with self._cond:
+            self._limit = limit
+            self._cond.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.release()
+
+
+def expand_wildcard_url(template: str) -> Iterator[str]:
+    """
+    Преобразует 'https://ex.com/file_{1..3}.csv' →
+    'https://ex.com/file_1.csv', ..., 'https://ex.com/file_3.csv'.
+    Шаблон проверяется сразу, а URL строятся лениво, по мере перебора
+    """
+    match = _WILDCARD_RE.search(template)
     if not match:
-        raise ValueError("Шаблон должен содержать {start..end}")
+        raise ValueError("Шаблон должен содержать {start..end}, например {1..10}")
+
     start_str, end_str = match.groups()
     start, end = int(start_str), int(end_str)
     if start > end:
-        raise ValueError("Начало > конца")
+        raise ValueError("Начало диапазона не может быть больше конца")
+
+    # Определяем ширину формата (для ведущих нулей)
     width = len(start_str) if start_str.startswith('0') and len(start_str) > 1 else 0
-    return [
-        template[:match.start()] + (str(i).zfill(width) if width else str(i)) + template[match.end():]
-        for i in range(start, end + 1)
-    ]
+    # Один шаблон для str.format; фигурные скобки вне диапазона экранируем
+    prefix, suffix = (
+        part.replace('{', '{{').replace('}', '}}')
+        for part in (template[:match.start()], template[match.end():])
+    )
+    fmt = prefix + (f"{{:0{width}d}}" if width else "{}") + suffix
+    return map(fmt.format, range(start, end + 1))
+
+
+# Общая HTTP-сессия модуля и цикл событий, к которому она привязана
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def create_session(max_concurrent: int = MAX_CONCURRENT) -> aiohttp.ClientSession:
+    """Создаёт HTTP-сессию с пулом на max_concurrent одновременных соединений к хосту"""
+    timeout = aiohttp.ClientTimeout(total=30, connect=10)
+    # Пул соединений: переиспользуем TCP/TLS-соединения к одному хосту
+    connector = aiohttp.TCPConnector(
+        limit=max_concurrent * 2,
+        limit_per_host=max_concurrent,
+        keepalive_timeout=75,
+        ttl_dns_cache=300,
+    )
+    # Файлы нужны байт в байт: сжатие не запрашиваем и не распаковываем,
+    # иначе Range-смещения при докачке относились бы к сжатому потоку
+    return aiohttp.ClientSession(
+        timeout=timeout,
+        connector=connector,
+        headers={'Accept-Encoding': 'identity'},
+        auto_decompress=False,
+        read_bufsize=DEFAULT_CHUNK_SIZE,
+    )
+
+
+async def get_session(max_concurrent: int = MAX_CONCURRENT) -> aiohttp.ClientSession:
+    """Возвращает общую сессию, создавая её при первом обращении в текущем цикле событий"""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        # Соединений нужно на все одновременные передачи, а не только на потоки
+        _session = create_session(max_concurrent * TRANSFERS_PER_SLOT)
+        _session_loop = loop
+    return _session
+
+
+async def close_session():
+    """Закрывает общую сессию, если она была открыта"""
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+
+def url_filename(url: str, with_query: bool = False) -> str:
+    """
+    Имя файла из пути URL с раскодированными %XX.
+    Query-строка добавляется перед расширением только при with_query,
+    символы, недопустимые в именах файлов, заменяются на '_'
+    """
+    parsed = urlparse(url)
+    name = unquote(parsed.path.rsplit('/', 1)[-1])
+    if with_query and parsed.query:
+        stem, ext = os.path.splitext(name)
+        name = f"{stem}_{_UNSAFE_NAME_RE.sub('_', unquote(parsed.query))}{ext}"
+    return name
+
+
+def names_may_collide(template: str) -> bool:
+    """
+    Могут ли разные URL шаблона дать одно имя файла: только если диапазон
+    {start..end} стоит вне последнего сегмента пути (в каталоге или query-строке)
+    """
+    match = _WILDCARD_RE.search(template)
+    # Диапазон заменяем символом, которого не бывает в URL, и ищем его в имени
+    path = urlparse(template[:match.start()] + '\0' + template[match.end():]).path
+    return '\0' not in path.rsplit('/', 1)[-1]
+
+
+def claim_path(claimed: Optional[Set[str]], output_path: Path, url: str) -> Optional[Path]:
+    """
+    Путь для url в output_path с именем, ещё не занятым другим URL: сначала имя
+    из пути, при совпадении — имя с query-строкой. None, если заняты оба:
+    два задания никогда не пишут в один файл.
+    claimed — выданные имена; None, если имена шаблона совпасть не могут
+    """
+    if claimed is None:
+        return output_path / url_filename(url)
+    for name in (url_filename(url), url_filename(url, with_query=True)):
+        if name not in claimed:
+            claimed.add(name)
+            return output_path / name
+    return None
+
+
+def preallocate(fd: int, size: int) -> None:
+    """
+    Резервирует место под файл целиком, чтобы ФС выделила его одним куском.
+    Где posix_fallocate недоступен, файл просто увеличивается до нужного размера.
+    """
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+    os.ftruncate(fd, size)
+
+
+def split_ranges(start: int, end: int, parts: int) -> List[Tuple[int, int]]:
+    """Делит байты [start, end) на parts почти равных полуинтервалов"""
+    step, rest = divmod(end - start, parts)
+    bounds = []
+    for i in range(parts):
+        size = step + (1 if i < rest else 0)
+        bounds.append((start, start + size))
+        start += size
+    return bounds
+
+
+def file_size(path: Path) -> int:
+    """Размер файла в байтах или 0, если файла нет (один вызов stat)"""
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def get_part_path(filepath: Path) -> Path:
+    """Путь временного файла, в который идёт загрузка"""
+    return filepath.with_name(f"{filepath.name}.part")
 
 
 def get_meta_path(filepath: Path) -> Path:
+    """Путь метафайла, которым GUI помечает незавершённую загрузку"""
     return filepath.parent / f".{filepath.name}.meta"
 
 
+def is_downloaded(filepath: Path) -> bool:
+    """
+    Файл уже загружен: существует, не пуст и рядом нет метафайла
+    (файл с метафайлом прежние версии GUI писали на месте, он может быть недокачан)
+    """
+    return file_size(filepath) > 0 and not get_meta_path(filepath).exists()
+
+
+def finish_download(filepath: Path) -> None:
+    """Переносит загруженный .part на место итогового файла и удаляет метафайл"""
+    get_part_path(filepath).replace(filepath)
+    get_meta_path(filepath).unlink(missing_ok=True)
+
+
+def format_meta(server_size: Optional[int], url: str) -> bytes:
+    """Метафайл — две строки: размер на сервере (пусто, если неизвестен) и URL"""
+    return f"{'' if server_size is None else server_size}\n{url}\n".encode('utf-8')
+
+
+def parse_meta(data: bytes) -> Tuple[Optional[int], str]:
+    """Разбирает содержимое метафайла в (server_size, url)"""
+    size, url = data.decode('utf-8').split('\n')[:2]
+    return (int(size) if size else None), url
+
+
+def read_meta(meta_path: Path) -> Optional[Tuple[Optional[int], str]]:
+    """
+    Читает метафайл; None, если его нет.
+    Повреждённый метафайл не совпадает ни с одной загрузкой
+    """
+    try:
+        data = meta_path.read_bytes()
+    except FileNotFoundError:
+        return None
+    try:
+        return parse_meta(data)
+    except ValueError:
+        return None, ''
+
+
+def write_meta(meta_path: Path, server_size: Optional[int], url: str) -> None:
+    """Записывает метафайл"""
+    meta_path.write_bytes(format_meta(server_size, url))
+
+
 async def download_files(
     url_template: str,
     output_dir: str,
     max_concurrent: int = 10,
-    chunk_size: int = 8192,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
     on_start: Callable[[str], None] = None,
     on_progress: Callable[[str, int, int], None] = None,
     on_complete: Callable[[str, bool, str], None] = None,
-    check_cancelled: Callable[[], bool] = None,
+    cancel_event: Optional[asyncio.Event] = None,
     resume: bool = True,
+    session: Optional[aiohttp.ClientSession] = None,
+    concurrency: Optional[AdjustableConcurrency] = None,
+    transfers: Optional[AdjustableConcurrency] = None,
 ):
     urls = expand_wildcard_url(url_template)
     output_path = Path(output_dir)
-    output_path.mkdir(parents=True, exist_ok=True)
+    # Операции с ФС — в пуле потоков: на сетевых дисках они могут подвисать
+    await asyncio.to_thread(output_path.mkdir, parents=True, exist_ok=True)
 
-    timeout = aiohttp.ClientTimeout(total=30, connect=10)
-    semaphore = asyncio.Semaphore(max_concurrent)
-
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        tasks = []
-        for url in urls:
-            if check_cancelled and check_cancelled():
-                raise DownloadCancelled("Загрузка отменена пользователем")
-            filename = url.split('/')[-1]
-            if on_start:
-                on_start(filename)
-            task = _download_single(
-                session, url, output_path, semaphore, chunk_size,
-                filename, on_progress, on_complete, check_cancelled, resume=resume
-            )
-            tasks.append(task)
-        await asyncio.gather(*tasks)
+    # Внешний ограничитель позволяет менять число потоков во время загрузки
+    if concurrency is None:
+        concurrency = AdjustableConcurrency(max_concurrent)
+    # Предел одновременных передач; при смене числа потоков меняется вместе с ним
+    if transfers is None:
+        transfers = AdjustableConcurrency(concurrency.limit * TRANSFERS_PER_SLOT)
+
+    # Сессия не закрывается по окончании: соединения остаются открытыми
+    # для следующего запуска
+    if session is None:
+        session = await get_session()
+
+    if cancel_event is None:
+        cancel_event = asyncio.Event()
+
+    if cancel_event.is_set():
+        raise DownloadCancelled("Загрузка отменена пользователем")
+
+    # URL строятся лениво; чтобы понять, меньше ли файлов, чем потоков,
+    # достаточно заглянуть на max_concurrent элементов вперёд
+    head = list(islice(urls, max_concurrent))
+    url_iter = chain(head, urls)
+
+    # Если файлов меньше, чем потоков, свободные потоки делят между файлами:
+    # крупные файлы качаются по частям
+    parallel_parts = max_concurrent // len(head) if len(head) < max_concurrent else 1
+
+    # Вариант загрузки выбирается один раз на весь пакет
+    fetch = _download_resume if resume else _download_fresh
+
+    # Занятые имена: разные URL (например, отличающиеся только query-строкой)
+    # не должны писать в один файл. Если диапазон стоит в имени файла, имена
+    # заведомо разные и ничего не запоминается — память не растёт с длиной диапазона
+    claimed: Optional[Set[str]] = set() if names_may_collide(url_template) else None
+
+    async def worker():
+        for url in url_iter:
+            filepath = claim_path(claimed, output_path, url)
+            if filepath is None:
+                # Строку в GUI заводим по URL: имя файла уже принадлежит другой загрузке
+                if on_start:
+                    on_start(url)
+                if on_complete:
+                    on_complete(url, False, "Имя файла совпадает с другим URL")
+                continue
+            # Загрузка файла целиком занимает место среди передач;
+            # поток (concurrency) — только на время установки соединений
+            async with transfers:
+                await _download_single(
+                    session, url, filepath, concurrency, chunk_size,
+                    on_start, on_progress, on_complete, fetch,
+                    parallel_parts=parallel_parts
+                )
+
+    # Воркеры разбирают URL из общего итератора по мере освобождения: число задач
+    # не зависит от длины списка. Сколько файлов качается одновременно, решает
+    # transfers — воркер ждёт его до on_start, так что строки в GUI появляются
+    # по мере старта файлов. Воркеров хватает на наибольший предел передач,
+    # до которого можно поднять число потоков во время загрузки
+    n_workers = max(transfers.limit, MAX_CONCURRENT * TRANSFERS_PER_SLOT)
+    if len(head) < max_concurrent:
+        n_workers = len(head)
+    downloads = asyncio.gather(*(worker() for _ in range(n_workers)))
+
+    # Ждём либо окончания загрузок, либо отмены: по событию отмены задачи
+    # прерываются сразу, на том await, где они сейчас стоят
+    cancel_wait = asyncio.ensure_future(cancel_event.wait())
+    try:
+        await asyncio.wait({downloads, cancel_wait}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        cancel_wait.cancel()
+    if not downloads.done():
+        downloads.cancel()
+        await asyncio.gather(downloads, return_exceptions=True)
+        raise DownloadCancelled("Загрузка отменена пользователем")
+    await downloads
 
 
 async def _download_single(
-    session, url, output_path, semaphore, chunk_size,
-    filename, on_progress, on_complete, check_cancelled, resume=True
+    session, url, filepath, concurrency, chunk_size,
+    on_start, on_progress, on_complete, fetch, parallel_parts=1
 ):
-    filepath = output_path / filename
+    """Загружает один файл вариантом fetch и сообщает результат через on_complete"""
+    filename = filepath.name
+    if on_start:
+        on_start(filename)
     meta_path = get_meta_path(filepath)
-    server_size = None
-    local_size = 0
 
     try:
-        # Шаг 1: Получаем размер файла на сервере
-        async with session.head(url) as head_resp:
-            if head_resp.status != 200:
-                #raise Exception(f"HEAD failed: {head_resp.status}")
-                accepts_ranges = False  # без размера — не можем возобновить
-            else:
-                server_size = head_resp.content_length
-                accepts_ranges = 'bytes' in head_resp.headers.get('Accept-Ranges', '').lower()
-
-        if server_size is None:
-            accepts_ranges = False  # без размера — не можем возобновить
-
-        # Шаг 2: Проверяем локальный файл
-        if filepath.exists():
-            local_size = filepath.stat().st_size
-            if resume and accepts_ranges and local_size < server_size:
-                # Возобновляем
-                headers = {'Range': f'bytes={local_size}-'}
-                mode = 'ab'
-                downloaded = local_size
-                if on_progress:
-                    on_progress(filename, downloaded, server_size)
-            elif local_size == server_size:
-                # Уже загружен
-                if on_complete:
-                    on_complete(filename, True, "Уже загружен")
-                return
-            else:
-                # Невозможно возобновить — перезаписываем
-                accepts_ranges = False
-                local_size = 0
-                mode = 'wb'
-                downloaded = 0
-        else:
-            # Новый файл
-            mode = 'wb'
-            downloaded = 0
-
-        # Сохраняем метаданные
-        meta_data = {'server_size': server_size, 'url': url}
-        async with aiofiles.open(meta_path, 'w') as mf:
-            await mf.write(json.dumps(meta_data))
-
-        # Шаг 3: Загружаем
-        headers = {'Range': f'bytes={downloaded}-'} if (accepts_ranges and downloaded > 0) else {}
-        async with semaphore:
-            async with session.get(url, headers=headers) as resp:
-                expected_status = 206 if (headers and accepts_ranges) else 200
-                if resp.status != expected_status:
-                    raise Exception(f"HTTP {resp.status} (ожидался {expected_status})")
-
-                total = server_size or resp.content_length or 0
-                async with aiofiles.open(filepath, mode) as f:
-                    async for chunk in resp.content.iter_chunked(chunk_size):
-                        if check_cancelled and check_cancelled():
-                            raise DownloadCancelled("Отменено во время загрузки")
-                        await f.write(chunk)
-                        downloaded += len(chunk)
-                        if on_progress:
-                            on_progress(filename, downloaded, total or downloaded)
-
-                if on_complete:
-                    on_complete(filename, True, "")
+        message = await fetch(
+            session, url, filepath, concurrency, chunk_size, on_progress, parallel_parts
+        )
+        if on_complete:
+            on_complete(filename, True, message)
 
-    except DownloadCancelled:
+    except asyncio.CancelledError:
         # Не удаляем файл при отмене — чтобы можно было возобновить!
         if on_complete:
             on_complete(filename, False, "Отменено (можно возобновить)")
@@ -147,8 +408,223 @@ async def _download_single(
     except Exception as e:
         # При ошибке удаляем метафайл, чтобы не мешать следующей попытке
         try:
-            meta_path.unlink(missing_ok=True)
+            await asyncio.to_thread(meta_path.unlink, missing_ok=True)
         except:
             pass
         if on_complete:
             on_complete(filename, False, str(e))
+
+
+async def _probe(session, url):
+    """HEAD-запрос: (размер на сервере или None, поддерживает ли сервер Range)"""
+    server_size = None
+    accepts_ranges = False
+    async with session.head(url) as head_resp:
+        if head_resp.status == 200:
+            server_size = head_resp.content_length
+            accepts_ranges = 'bytes' in head_resp.headers.get('Accept-Ranges', '').lower()
+    if server_size is None:
+        accepts_ranges = False  # без размера — не можем возобновить
+    return server_size, accepts_ranges
+
+
+async def _download_fresh(
+    session, url, filepath, concurrency, chunk_size, on_progress, parallel_parts
+):
+    """Загрузка без докачки: файл пишется заново, состояние на диске не проверяется"""
+    # HEAD нужен только для решения о загрузке по частям; иначе размер
+    # придёт в заголовках ответа на GET
+    server_size, accepts_ranges = None, False
+    if parallel_parts > 1:
+        server_size, accepts_ranges = await _probe(session, url)
+    return await _transfer(
+        session, url, filepath, concurrency, chunk_size, on_progress, parallel_parts,
+        'wb', 0, server_size, accepts_ranges, None
+    )
+
+
+async def _download_resume(
+    session, url, filepath, concurrency, chunk_size, on_progress, parallel_parts
+):
+    """Загрузка с докачкой: продолжает недокачанный .part, готовый файл — пропускает"""
+    # Итоговый файл появляется только после успешной загрузки (как и в CLI),
+    # поэтому для его пропуска запрос к серверу не нужен
+    if await asyncio.to_thread(is_downloaded, filepath):
+        return "Уже загружен"
+    local_size = await asyncio.to_thread(file_size, get_part_path(filepath))
+    if not local_size:
+        return await _download_fresh(
+            session, url, filepath, concurrency, chunk_size, on_progress, parallel_parts
+        )
+
+    # Шаг 1: Получаем размер файла на сервере
+    server_size, accepts_ranges = await _probe(session, url)
+
+    # Шаг 2: Проверяем .part; без метафайла (его начал CLI) верим размеру
+    meta = await asyncio.to_thread(read_meta, get_meta_path(filepath))
+    if meta is not None and meta != (server_size, url):
+        # Недокачанный файл от другого URL или другой версии файла на сервере
+        accepts_ranges = False
+    if accepts_ranges and local_size < server_size:
+        # Возобновляем
+        if on_progress:
+            on_progress(filepath.name, local_size, server_size)
+        return await _transfer(
+            session, url, filepath, concurrency, chunk_size, on_progress, parallel_parts,
+            'r+b', local_size, server_size, accepts_ranges, meta
+        )
+    # Невозможно возобновить (в том числе .part не меньше файла на сервере:
+    # процесс убит после предвыделения места) — качаем заново
+    return await _transfer(
+        session, url, filepath, concurrency, chunk_size, on_progress, parallel_parts,
+        'wb', 0, server_size, False, meta
+    )
+
+
+async def _transfer(
+    session, url, filepath, concurrency, chunk_size, on_progress, parallel_parts,
+    mode, downloaded, server_size, accepts_ranges, meta
+):
+    """
+    Шаг 3: загружает файл в .part с позиции downloaded и переносит его на место
+    filepath; возвращает сообщение для on_complete.
+    meta — уже прочитанный метафайл (None, если его нет): совпадающий не перезаписывается
+    """
+    filename = filepath.name
+    part_path = get_part_path(filepath)
+    meta_path = get_meta_path(filepath)
+
+    parts = 1
+    # Куски пишутся через os.pwrite, которого нет под Windows
+    if accepts_ranges and server_size >= PARALLEL_MIN_SIZE and hasattr(os, "pwrite"):
+        parts = min(parallel_parts, (server_size - downloaded) // PARALLEL_MIN_PART)
+    if parts > 1:
+        if meta != (server_size, url):
+            await asyncio.to_thread(write_meta, meta_path, server_size, url)
+        await _download_parallel(
+            session, url, part_path, filename, concurrency, chunk_size,
+            downloaded, server_size, parts, on_progress
+        )
+        await asyncio.to_thread(finish_download, filepath)
+        return ""
+
+    headers = {'Range': f'bytes={downloaded}-'} if downloaded else {}
+    # Поток занимаем только на время установки соединения и получения заголовков:
+    # медленный файл не держит его, пока качается. Число одновременных передач
+    # ограничивает transfers в download_files
+    async with concurrency:
+        # chunk_size задаёт размер буфера чтения сокета; данные забираем по мере поступления
+        resp = await session.get(url, headers=headers, read_bufsize=chunk_size)
+    async with resp:
+        expected_status = 206 if headers else 200
+        if resp.status != expected_status:
+            raise Exception(f"HTTP {resp.status} (ожидался {expected_status})")
+
+        total = server_size or resp.content_length or 0
+
+        # Сохраняем метаданные: по ним следующий запуск проверит, можно ли продолжить .part
+        if meta != (total or None, url):
+            await asyncio.to_thread(write_meta, meta_path, total or None, url)
+
+        with open(part_path, mode, buffering=WRITE_BUFFER_SIZE) as f:
+            try:
+                if total:
+                    preallocate(f.fileno(), total)
+                f.seek(downloaded)
+                # Горячий цикл: методы заранее в локальных переменных,
+                # проверка наличия on_progress — один раз, а не на каждый кусок
+                write = f.write
+                chunks = resp.content.iter_any()
+                if on_progress is None:
+                    async for chunk in chunks:
+                        write(chunk)
+                        downloaded += len(chunk)
+                else:
+                    clock = asyncio.get_running_loop().time
+                    last_emit_bytes = downloaded
+                    last_emit_time = clock()
+                    async for chunk in chunks:
+                        write(chunk)
+                        downloaded += len(chunk)
+                        now = clock()
+                        if (downloaded - last_emit_bytes >= PROGRESS_EMIT_BYTES
+                                or now - last_emit_time >= PROGRESS_EMIT_INTERVAL
+                                or downloaded == total):
+                            on_progress(filename, downloaded, total or downloaded)
+                            last_emit_bytes = downloaded
+                            last_emit_time = now
+                    # Итоговое значение сообщаем всегда
+                    if downloaded != last_emit_bytes:
+                        on_progress(filename, downloaded, total or downloaded)
+            finally:
+                # Отрезаем незаполненный хвост предвыделенного места,
+                # чтобы размер файла означал число реально полученных байт
+                f.truncate(downloaded)
+
+    # Загрузка завершена — .part становится итоговым файлом, метафайл больше не нужен
+    await asyncio.to_thread(finish_download, filepath)
+    return ""
+
+
+async def _download_parallel(
+    session, url, part_path, filename, concurrency, chunk_size,
+    start, total, parts, on_progress
+):
+    """
+    Загружает байты [start, total) файла parts параллельными Range-запросами,
+    записывая каждый кусок в part_path по своему смещению через os.pwrite
+    """
+    bounds = split_ranges(start, total, parts)
+    done = [0] * parts
+    loop = asyncio.get_running_loop()
+    last_emit_bytes = start
+    last_emit_time = loop.time()
+
+    async def fetch_range(i, first, end):
+        nonlocal last_emit_bytes, last_emit_time
+        headers = {'Range': f'bytes={first}-{end - 1}'}
+        async with concurrency:
+            resp = await session.get(url, headers=headers, read_bufsize=chunk_size)
+        async with resp:
+            if resp.status != 206:
+                raise Exception(f"HTTP {resp.status} (ожидался 206)")
+            offset = first
+            pwrite = os.pwrite
+            async for chunk in resp.content.iter_any():
+                pwrite(fd, chunk, offset)
+                offset += len(chunk)
+                done[i] += len(chunk)
+                if on_progress is not None:
+                    now = loop.time()
+                    downloaded = start + sum(done)
+                    if (downloaded - last_emit_bytes >= PROGRESS_EMIT_BYTES
+                            or now - last_emit_time >= PROGRESS_EMIT_INTERVAL):
+                        on_progress(filename, downloaded, total)
+                        last_emit_bytes = downloaded
+                        last_emit_time = now
+
+    # Без буфера: куски пишутся напрямую по своим смещениям
+    fd = os.open(part_path, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        preallocate(fd, total)
+        tasks = [
+            asyncio.ensure_future(fetch_range(i, first, end))
+            for i, (first, end) in enumerate(bounds)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        # Оставляем только непрерывно загруженное начало файла — с него можно продолжить
+        received = start
+        for (first, end), size in zip(bounds, done):
+            received = first + size
+            if received < end:
+                break
+        os.ftruncate(fd, received)
+        os.close(fd)
+    if on_progress:
+        on_progress(filename, total, total)
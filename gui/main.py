@@ -6,17 +6,22 @@ from pathlib import Path
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLineEdit, QPushButton, QTabWidget, QTextEdit, QLabel, QProgressBar,
-    QScrollArea, QFrame, QCheckBox
+    QScrollArea, QFrame, QCheckBox, QSpinBox
+)
+from PySide6.QtCore import Signal, QObject
+from downloader import (
+    download_files, close_session, AdjustableConcurrency, DownloadCancelled,
+    MAX_CONCURRENT, TRANSFERS_PER_SLOT, get_part_path, get_meta_path
 )
-from PySide6.QtCore import Signal, QObject, QTimer
-from downloader import download_files
 
 
 class DownloaderSignals(QObject):
     """Сигналы для общения между потоками"""
-    file_started = Signal(str)
+    files_started = Signal(list)
     file_progress = Signal(str, int, int)
     file_finished = Signal(str, bool, str)
+    log_message = Signal(str)
+    batch_finished = Signal()
 
 
 class DownloadManager:
@@ -24,14 +29,26 @@ class DownloadManager:
         self.signals = signals
         self.progress_bars = {}  # filename -> QProgressBar
         self.labels = {}  # filename -> QLabel (статус)
+        self._started = []  # файлы, начатые в текущей итерации цикла событий
 
     def on_file_start(self, filename: str):
-        self.signals.file_started.emit(filename)
+        # Старты, пришедшие в одной итерации цикла, уходят в GUI одним сигналом
+        if not self._started:
+            asyncio.get_running_loop().call_soon(self._flush_started)
+        self._started.append(filename)
+
+    def _flush_started(self):
+        if self._started:
+            started, self._started = self._started, []
+            self.signals.files_started.emit(started)
 
     def on_file_progress(self, filename: str, done: int, total: int):
+        # Строка файла должна появиться в GUI раньше его прогресса и результата
+        self._flush_started()
         self.signals.file_progress.emit(filename, done, total)
 
     def on_file_complete(self, filename: str, success: bool, error: str):
+        self._flush_started()
         self.signals.file_finished.emit(filename, success, error)
 
 
@@ -41,9 +58,15 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Файловый загрузчик")
         self.resize(800, 600)
 
-        # Состояние отмены
-        self._cancelled = False
-        self._download_thread = None
+        # Состояние отмены: событие создаётся на каждый запуск
+        self._cancel_event = asyncio.Event()
+        self._download_future = None
+
+        # Постоянный цикл событий в фоновом потоке: общая HTTP-сессия
+        # и её соединения переживают несколько запусков подряд
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._loop_thread.start()
 
         # Центральный виджет
         central = QWidget()
@@ -61,12 +84,21 @@ class MainWindow(QMainWindow):
         self.cancel_btn.clicked.connect(self.cancel_download)
         self.resume_checkbox = QCheckBox("Возобновлять загрузку")
         self.resume_checkbox.setChecked(True)
+        # Число потоков можно менять и во время загрузки
+        self.concurrency_spin = QSpinBox()
+        self.concurrency_spin.setRange(1, MAX_CONCURRENT)
+        self.concurrency_spin.setValue(10)
+        self.concurrency_spin.setPrefix("Потоков: ")
+        self.concurrency_spin.valueChanged.connect(self.set_concurrency)
+        self._concurrency = AdjustableConcurrency(self.concurrency_spin.value())
+        self._transfers = AdjustableConcurrency(self.concurrency_spin.value() * TRANSFERS_PER_SLOT)
         self.clear_btn = QPushButton("Очистить частичные")
         self.clear_btn.clicked.connect(self.clear_partial_downloads)
         input_layout.addWidget(self.url_input)
         input_layout.addWidget(self.start_btn)
         input_layout.addWidget(self.cancel_btn)
         input_layout.addWidget(self.resume_checkbox)
+        input_layout.addWidget(self.concurrency_spin)
         input_layout.addWidget(self.clear_btn)
         layout.addLayout(input_layout)
 
@@ -93,27 +125,35 @@ class MainWindow(QMainWindow):
         self.setup_connections()
 
     def setup_connections(self):
-        self.signals.file_started.connect(self.add_file_entry)
+        self.signals.files_started.connect(self.add_file_entries)
         self.signals.file_progress.connect(self.update_progress)
         self.signals.file_finished.connect(self.mark_finished)
+        self.signals.log_message.connect(self.log)
+        self.signals.batch_finished.connect(self.download_finished)
 
     def log(self, message: str):
         self.log_text.append(message)
 
-    def add_file_entry(self, filename: str):
-        frame = QFrame()
-        frame.setFrameShape(QFrame.StyledPanel)
-        frame_layout = QHBoxLayout(frame)
-        label = QLabel(filename)
-        label.setFixedWidth(200)
-        progress = QProgressBar()
-        progress.setRange(0, 100)
-        frame_layout.addWidget(label)
-        frame_layout.addWidget(progress)
-        self.scroll_layout.addWidget(frame)
-        self.download_manager.progress_bars[filename] = progress
-        self.download_manager.labels[filename] = label
-        self.log(f"📥 Начата загрузка: {filename}")
+    def add_file_entries(self, filenames: list):
+        # Перерисовка — один раз после добавления всех строк
+        self.scroll_content.setUpdatesEnabled(False)
+        try:
+            for filename in filenames:
+                frame = QFrame()
+                frame.setFrameShape(QFrame.StyledPanel)
+                frame_layout = QHBoxLayout(frame)
+                label = QLabel(filename)
+                label.setFixedWidth(200)
+                progress = QProgressBar()
+                progress.setRange(0, 100)
+                frame_layout.addWidget(label)
+                frame_layout.addWidget(progress)
+                self.scroll_layout.addWidget(frame)
+                self.download_manager.progress_bars[filename] = progress
+                self.download_manager.labels[filename] = label
+        finally:
+            self.scroll_content.setUpdatesEnabled(True)
+        self.log("\n".join(f"📥 Начата загрузка: {filename}" for filename in filenames))
 
     def update_progress(self, filename: str, done: int, total: int):
         if filename in self.download_manager.progress_bars:
@@ -138,84 +178,84 @@ class MainWindow(QMainWindow):
             pb.setValue(100 if success else 0)
 
     def start_download(self):
-        if self._download_thread and self._download_thread.is_alive():
+        if self._download_future and not self._download_future.done():
             return
         template = self.url_input.text().strip()
         if not template:
             self.log("⚠️ Шаблон не задан!")
             return
 
-        self._cancelled = False
+        self._cancel_event = asyncio.Event()
         self.start_btn.setEnabled(False)
         self.cancel_btn.setEnabled(True)
         self.log(f"🚀 Запуск загрузки: {template}")
 
-        self._download_thread = threading.Thread(
-            target=self.run_async_download,
-            args=(template,),
-            daemon=True
+        self._download_future = asyncio.run_coroutine_threadsafe(
+            self.run_async_download(template), self._loop
         )
-        self._download_thread.start()
 
     def cancel_download(self):
-        self._cancelled = True
+        # Событие принадлежит циклу загрузки — выставляем его из его же потока
+        self._loop.call_soon_threadsafe(self._cancel_event.set)
         self.cancel_btn.setEnabled(False)
         self.log("🛑 Запрошена отмена загрузки...")
 
-    def is_cancelled(self):
-        return self._cancelled
+    def set_concurrency(self, value: int):
+        asyncio.run_coroutine_threadsafe(self._concurrency.set_limit(value), self._loop)
+        asyncio.run_coroutine_threadsafe(
+            self._transfers.set_limit(value * TRANSFERS_PER_SLOT), self._loop
+        )
 
-    def run_async_download(self, template: str):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+    async def run_async_download(self, template: str):
         try:
-            loop.run_until_complete(
-                download_files(
-                    url_template=template,
-                    output_dir="./downloads",
-                    max_concurrent=10,
-                    on_start=self.download_manager.on_file_start,
-                    on_progress=self.download_manager.on_file_progress,
-                    on_complete=self.download_manager.on_file_complete,
-                    check_cancelled=self.is_cancelled,
-                    resume=self.resume_checkbox.isChecked(),
-                )
+            await download_files(
+                url_template=template,
+                output_dir="./downloads",
+                max_concurrent=self._concurrency.limit,
+                on_start=self.download_manager.on_file_start,
+                on_progress=self.download_manager.on_file_progress,
+                on_complete=self.download_manager.on_file_complete,
+                cancel_event=self._cancel_event,
+                resume=self.resume_checkbox.isChecked(),
+                concurrency=self._concurrency,
+                transfers=self._transfers,
             )
+        except DownloadCancelled:
+            self.signals.log_message.emit("⏹️ Загрузка отменена.")
         except Exception as e:
-            if "Отменено" in str(e):
-                QTimer.singleShot(0, lambda: self.log("⏹️ Загрузка отменена."))
-            else:
-                QTimer.singleShot(0, lambda: self.log(f"💥 Критическая ошибка: {e}"))
+            self.signals.log_message.emit(f"💥 Критическая ошибка: {e}")
         finally:
-            loop.close()
-            QTimer.singleShot(0, self.download_finished)
+            self.signals.batch_finished.emit()
 
     def download_finished(self):
         self.start_btn.setEnabled(True)
         self.cancel_btn.setEnabled(False)
-        if not self._cancelled:
+        if not self._cancel_event.is_set():
             self.log("🏁 Все загрузки завершены!")
 
     def clear_partial_downloads(self):
-        """Удаляет все файлы, у которых есть .meta — считаем их незавершёнными"""
+        """
+        Удаляет незавершённые загрузки: .part-файлы (их оставляют и GUI, и CLI)
+        с метафайлами, а также файлы, рядом с которыми лежит .meta
+        """
         output_dir = Path("./downloads")
         if not output_dir.exists():
             self.log("📂 Папка загрузок пуста.")
             return
 
+        # Имена оригинальных файлов: ".file.csv.meta" → "file.csv", "file.csv.part" → "file.csv"
+        with_meta = {f.name[1:-5] for f in output_dir.glob(".*.meta") if f.is_file()}
+        partial = with_meta | {f.name[:-5] for f in output_dir.glob("*.part") if f.is_file()}
+
         deleted_files = []
-        for meta_file in output_dir.glob(".*.meta"):
-            if not meta_file.is_file():
-                continue
-            # Имя оригинального файла: убираем точку в начале и .meta в конце
-            orig_name = meta_file.name[1:-5]  # например: ".file.csv.meta" → "file.csv"
+        for orig_name in sorted(partial):
             orig_path = output_dir / orig_name
-
             try:
-                # Удаляем оригинальный файл и мета
-                if orig_path.exists():
-                    orig_path.unlink()
-                meta_file.unlink()
+                get_part_path(orig_path).unlink(missing_ok=True)
+                if orig_name in with_meta:
+                    # Файл с метафайлом прежние версии писали на месте — он тоже частичный
+                    orig_path.unlink(missing_ok=True)
+                    get_meta_path(orig_path).unlink()
                 deleted_files.append(orig_name)
             except Exception as e:
                 self.log(f"⚠️ Не удалось удалить {orig_name}: {e}")
@@ -230,6 +270,16 @@ class MainWindow(QMainWindow):
 
         self.start_btn.setEnabled(True)
 
+    def closeEvent(self, event):
+        """Закрывает общую HTTP-сессию и останавливает фоновый цикл событий"""
+        future = asyncio.run_coroutine_threadsafe(close_session(), self._loop)
+        try:
+            future.result(timeout=5)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        super().closeEvent(event)
+
     def clear_download_list(self):
         """Очищает список файлов в GUI-вкладке 'Загрузки'"""
         while self.scroll_layout.count():
@@ -0,0 +1,54 @@
+# tests/conftest.py
+import pytest_asyncio
+from aiohttp import web
+
+DATA = bytes(range(256)) * 32  # 8 КиБ
+
+
+def parse_range(header, size):
+    """'bytes=a-' / 'bytes=a-b' → (a, b) как полуинтервал"""
+    first, _, last = header[len("bytes="):].partition("-")
+    return int(first), (int(last) + 1 if last else size)
+
+
+def range_files(data, requests):
+    """
+    Обработчик, отдающий data с поддержкой Range (416 за концом файла);
+    каждый запрос пишется в requests как (метод, заголовок Range)
+    """
+    async def files(request):
+        header = request.headers.get("Range")
+        requests.append((request.method, header))
+        if not header:
+            return web.Response(body=data, headers={"Accept-Ranges": "bytes"})
+        first, end = parse_range(header, len(data))
+        if first >= len(data):
+            return web.Response(status=416)
+        return web.Response(
+            status=206, body=data[first:end],
+            headers={"Accept-Ranges": "bytes",
+                     "Content-Range": f"bytes {first}-{end - 1}/{len(data)}"},
+        )
+
+    return files
+
+
+@pytest_asyncio.fixture
+async def serve():
+    """Запускает локальный HTTP-сервер: await serve({маршрут: обработчик}) → базовый URL"""
+    runners = []
+
+    async def start(routes):
+        app = web.Application()
+        for path, handler in routes.items():
+            app.router.add_get(path, handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        runners.append(runner)
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        return f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+    yield start
+    for runner in runners:
+        await runner.cleanup()
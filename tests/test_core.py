@@ -1,6 +1,12 @@
 # tests/test_core.py
+import asyncio
 import pytest
-from download_files import expand_wildcard_url, load_config
+import aiohttp
+from download_files import (
+    expand_wildcard_url, load_config, is_transient_error, retry_delay, url_filename,
+    BatchState, COMPLETED_SHOWN, get_part_path, preallocate, split_ranges,
+    is_downloaded, claim_path, names_may_collide, get_meta_path, finish_download
+)
 import tempfile
 import yaml
 from pathlib import Path
@@ -13,7 +19,7 @@ def test_expand_wildcard_simple():
         "http://example.com/file_2.csv",
         "http://example.com/file_3.csv",
     ]
-    assert expand_wildcard_url(template) == expected
+    assert list(expand_wildcard_url(template)) == expected
 
 
 def test_expand_wildcard_leading_zeros():
@@ -23,7 +29,21 @@ def test_expand_wildcard_leading_zeros():
         "https://data.org/img_002.png",
         "https://data.org/img_003.png",
     ]
-    assert expand_wildcard_url(template) == expected
+    assert list(expand_wildcard_url(template)) == expected
+
+
+def test_expand_wildcard_keeps_other_braces():
+    template = "https://data.org/{dir}/img_{1..2}.png"
+    assert list(expand_wildcard_url(template)) == [
+        "https://data.org/{dir}/img_1.png",
+        "https://data.org/{dir}/img_2.png",
+    ]
+
+
+def test_expand_wildcard_is_lazy():
+    urls = expand_wildcard_url("http://x.com/{1..1000000000}.bin")
+    assert next(urls) == "http://x.com/1.bin"
+    assert next(urls) == "http://x.com/2.bin"
 
 
 def test_expand_wildcard_invalid_range():
@@ -36,6 +56,106 @@ def test_expand_wildcard_no_braces():
         expand_wildcard_url("http://x.com/file.csv")
 
 
+def test_url_filename():
+    assert url_filename("http://x.com/dir/data_1.csv") == "data_1.csv"
+    assert url_filename("http://x.com/my%20file.csv?token=abc") == "my file.csv"
+    assert url_filename(
+        "http://x.com/data.csv?id=1&d=a/b", with_query=True
+    ) == "data_id=1&d=a_b.csv"
+    assert url_filename("http://x.com/data.csv", with_query=True) == "data.csv"
+
+
+def test_names_may_collide():
+    assert not names_may_collide("http://x.com/dir/data_{1..3}.csv?token=abc")
+    assert not names_may_collide("http://x.com/{1..3}")
+    assert names_may_collide("http://x.com/data?id={1..3}")
+    assert names_may_collide("http://x.com/{1..3}/data.csv")
+    assert names_may_collide("http://x.com/data.csv#{1..3}")
+
+
+def test_claim_path_never_shares_a_file():
+    claimed = set()
+    out = Path("out")
+    assert claim_path(claimed, out, "http://x.com/data?id=1") == out / "data"
+    assert claim_path(claimed, out, "http://x.com/data?id=2") == out / "data_id=2"
+    # Имя из пути занято, а имя с query-строкой совпадает с уже выданным
+    claimed.add("data_id=3")
+    assert claim_path(claimed, out, "http://x.com/data?id=3") is None
+    assert claimed == {"data", "data_id=2", "data_id=3"}
+
+
+def test_claim_path_without_tracking():
+    out = Path("out")
+    assert claim_path(None, out, "http://x.com/data_1.csv?id=1") == out / "data_1.csv"
+
+
+def test_retry_delay_grows_and_is_capped():
+    assert 1.0 <= retry_delay(1.0, 0) <= 1.5
+    assert 4.0 <= retry_delay(1.0, 2) <= 6.0
+    assert retry_delay(1.0, 20) == 30.0
+
+
+def test_is_transient_error():
+    def http_error(status):
+        return aiohttp.ClientResponseError(request_info=None, history=(), status=status)
+
+    assert is_transient_error(http_error(503))
+    assert is_transient_error(http_error(429))
+    assert not is_transient_error(http_error(404))
+    assert is_transient_error(aiohttp.ClientConnectionError())
+    assert is_transient_error(asyncio.TimeoutError())
+
+
+def test_batch_state_keeps_only_recent_files():
+    state = BatchState()
+    for i in range(COMPLETED_SHOWN + 5):
+        state.add_completed(f"file_{i}")
+    state.add_failed("bad.csv", "HTTP 404")
+
+    assert state.completed_count == COMPLETED_SHOWN + 5
+    assert len(state.completed) == COMPLETED_SHOWN
+    assert state.completed[-1] == f"file_{COMPLETED_SHOWN + 4}"
+    assert list(state.failed) == [("bad.csv", "HTTP 404")]
+    assert state.failed_count == 1
+
+
+def test_get_part_path():
+    assert get_part_path(Path("out/data_1.csv")) == Path("out/data_1.csv.part")
+
+
+def test_is_downloaded(tmp_path):
+    path = tmp_path / "data.csv"
+    assert not is_downloaded(path)
+    path.write_bytes(b"")
+    assert not is_downloaded(path)
+    path.write_bytes(b"a,b")
+    assert is_downloaded(path)
+    # Метафайл GUI рядом — файл может быть недокачан
+    get_meta_path(path).write_bytes(b"3\nhttp://x.com/data.csv\n")
+    assert not is_downloaded(path)
+
+
+def test_finish_download(tmp_path):
+    path = tmp_path / "data.csv"
+    get_part_path(path).write_bytes(b"a,b")
+    get_meta_path(path).write_bytes(b"3\nhttp://x.com/data.csv\n")
+    finish_download(path)
+    assert path.read_bytes() == b"a,b"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["data.csv"]
+
+
+def test_preallocate(tmp_path):
+    path = tmp_path / "file.bin"
+    with open(path, "wb") as f:
+        preallocate(f.fileno(), 4096)
+    assert path.stat().st_size == 4096
+
+
+def test_split_ranges():
+    assert split_ranges(0, 10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert split_ranges(100, 108, 2) == [(100, 104), (104, 108)]
+
+
 def test_load_config():
     config_data = {
         "download": {
@@ -0,0 +1,126 @@
+# tests/test_download.py
+import asyncio
+import errno
+import pytest
+import pytest_asyncio
+import aiohttp
+from aiohttp import web
+from rich.progress import Progress
+import download_files
+from download_files import _fetch_to_file, _stream_to_file, get_part_path, download_all
+from .conftest import DATA, parse_range, range_files
+
+
+@pytest_asyncio.fixture
+async def server(serve):
+    """Локальный HTTP-сервер с поддержкой Range; в requests пишутся (метод, Range)"""
+    requests = []
+
+    async def flaky(request):
+        # Первый кусок отдаётся, остальные после паузы падают с 500
+        header = request.headers.get("Range")
+        if request.method == "HEAD" or not header:
+            return web.Response(body=DATA, headers={"Accept-Ranges": "bytes"})
+        first, end = parse_range(header, len(DATA))
+        if first:
+            await asyncio.sleep(0.2)
+            return web.Response(status=500)
+        return web.Response(status=206, body=DATA[first:end])
+
+    async def by_id(request):
+        return web.Response(body=f"id={request.query['id']}".encode())
+
+    base = await serve({
+        "/files/{name}": range_files(DATA, requests),
+        "/flaky/{name}": flaky,
+        "/q/{name}": by_id,
+    })
+    return base, requests
+
+
+async def fetch(url, filepath, resume=True, parallel_parts=1):
+    progress = Progress()
+    task_id = progress.add_task("download", filename=filepath.name, total=None)
+    async with aiohttp.ClientSession() as session:
+        await _fetch_to_file(
+            session, url, filepath, 1024, progress, task_id, resume, parallel_parts
+        )
+
+
+@pytest.mark.asyncio
+async def test_fetch_resumes_part_file(server, tmp_path):
+    base, requests = server
+    filepath = tmp_path / "data.bin"
+    get_part_path(filepath).write_bytes(DATA[:1000])
+    await fetch(f"{base}/files/data.bin", filepath)
+    assert requests == [("GET", "bytes=1000-")]
+    assert filepath.read_bytes() == DATA
+    assert not get_part_path(filepath).exists()
+
+
+@pytest.mark.asyncio
+async def test_fetch_restarts_on_416(server, tmp_path):
+    base, requests = server
+    filepath = tmp_path / "data.bin"
+    # .part уже полного размера: процесс был убит после предвыделения места
+    get_part_path(filepath).write_bytes(b"\0" * len(DATA))
+    await fetch(f"{base}/files/data.bin", filepath)
+    assert requests == [("GET", f"bytes={len(DATA)}-"), ("GET", None)]
+    assert filepath.read_bytes() == DATA
+
+
+@pytest.mark.asyncio
+async def test_fetch_parallel_ranges(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(download_files, "PARALLEL_MIN_PART", 1024)
+    base, requests = server
+    filepath = tmp_path / "data.bin"
+    await fetch(f"{base}/files/data.bin", filepath, parallel_parts=4)
+    assert requests[0] == ("HEAD", None)
+    assert sorted(header for _, header in requests[1:]) == [
+        "bytes=0-2047", "bytes=2048-4095", "bytes=4096-6143", "bytes=6144-8191"
+    ]
+    assert filepath.read_bytes() == DATA
+
+
+@pytest.mark.asyncio
+async def test_fetch_parallel_keeps_contiguous_prefix(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(download_files, "PARALLEL_MIN_PART", 1024)
+    base, _ = server
+    filepath = tmp_path / "data.bin"
+    with pytest.raises(aiohttp.ClientResponseError):
+        await fetch(f"{base}/flaky/data.bin", filepath, parallel_parts=4)
+    # Первый кусок цел, предвыделенный хвост за ним отрезан
+    assert get_part_path(filepath).read_bytes() == DATA[:2048]
+    assert not filepath.exists()
+
+
+@pytest.mark.asyncio
+async def test_download_all_keeps_urls_differing_by_query(server, tmp_path):
+    base, _ = server
+    config = {
+        "download": {"url_template": f"{base}/q/data?id={{1..3}}", "output_dir": str(tmp_path)},
+        "http": {"timeout": {"total": 10, "connect": 5}},
+    }
+    state = await download_all(config)
+    assert state.completed_count == 3 and state.failed_count == 0
+    assert {p.name: p.read_text() for p in tmp_path.iterdir()} == {
+        "data": "id=1", "data_id=2": "id=2", "data_id=3": "id=3",
+    }
+
+
+@pytest.mark.asyncio
+async def test_stream_to_file_propagates_write_error():
+    class Content:
+        async def iter_any(self):
+            for _ in range(20):
+                yield b"x" * 10
+
+    class FullDisk:
+        def write(self, data):
+            raise OSError(errno.ENOSPC, "No space left on device")
+
+    written = []
+    with pytest.raises(OSError) as exc_info:
+        await _stream_to_file(Content(), FullDisk(), written.append)
+    assert exc_info.value.errno == errno.ENOSPC
+    assert written == []
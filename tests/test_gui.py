@@ -0,0 +1,269 @@
+# tests/test_gui.py
+import asyncio
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+import pytest
+import pytest_asyncio
+import aiohttp
+from aiohttp import web
+
+# gui/ запускается как отдельное приложение и импортирует downloader напрямую
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "gui"))
+import downloader  # noqa: E402
+from downloader import (  # noqa: E402
+    AdjustableConcurrency, download_files, TRANSFERS_PER_SLOT,
+    format_meta, parse_meta, read_meta, write_meta
+)
+from .conftest import DATA, range_files  # noqa: E402
+
+
+async def settle():
+    """Даёт ожидающим корутинам отработать"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_concurrency_blocks_at_limit():
+    limiter = AdjustableConcurrency(1)
+    await limiter.acquire()
+    waiter = asyncio.ensure_future(limiter.acquire())
+    await settle()
+    assert not waiter.done()
+    await limiter.release()
+    await settle()
+    assert waiter.done()
+
+
+@pytest.mark.asyncio
+async def test_concurrency_set_limit_wakes_waiters():
+    limiter = AdjustableConcurrency(1)
+    await limiter.acquire()
+    waiters = [asyncio.ensure_future(limiter.acquire()) for _ in range(2)]
+    await settle()
+    assert not any(w.done() for w in waiters)
+    await limiter.set_limit(3)
+    await settle()
+    assert all(w.done() for w in waiters)
+    assert limiter.limit == 3
+
+
+def test_meta_round_trip():
+    url = "http://x.com/data_1.csv"
+    assert parse_meta(format_meta(1234, url)) == (1234, url)
+    assert parse_meta(format_meta(None, url)) == (None, url)
+
+
+def test_read_meta(tmp_path):
+    meta_path = tmp_path / ".data.csv.meta"
+    assert read_meta(meta_path) is None
+    # Метафайл старого формата (JSON) не совпадает ни с одной загрузкой
+    meta_path.write_text('{"server_size": 10, "url": "http://x.com/data.csv"}')
+    assert read_meta(meta_path) == (None, '')
+    meta_path.write_bytes(format_meta(10, "http://x.com/data.csv"))
+    assert read_meta(meta_path) == (10, "http://x.com/data.csv")
+
+
+def test_write_meta_overwrites(tmp_path):
+    meta_path = tmp_path / ".data.csv.meta"
+    write_meta(meta_path, 10, "http://x.com/data.csv")
+    write_meta(meta_path, None, "http://x.com/data.csv")
+    assert read_meta(meta_path) == (None, "http://x.com/data.csv")
+
+
+@pytest_asyncio.fixture
+async def slow_server(serve):
+    """Сервер, медленно отдающий файлы; в stats — пик одновременных передач"""
+    stats = {"active": 0, "peak": 0}
+
+    async def slow(request):
+        stats["active"] += 1
+        stats["peak"] = max(stats["peak"], stats["active"])
+        try:
+            resp = web.StreamResponse()
+            resp.content_length = 4096
+            await resp.prepare(request)
+            for _ in range(4):
+                await resp.write(b"x" * 1024)
+                await asyncio.sleep(0.02)
+            return resp
+        finally:
+            stats["active"] -= 1
+
+    return await serve({"/{name}": slow}), stats
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("limit", [1, 3])
+async def test_download_files_bounds_simultaneous_transfers(slow_server, tmp_path, limit):
+    base, stats = slow_server
+    done = []
+    async with aiohttp.ClientSession() as session:
+        await download_files(
+            f"{base}/f_{{1..12}}.bin", str(tmp_path),
+            max_concurrent=limit, session=session,
+            on_complete=lambda name, ok, err: done.append(ok),
+        )
+    assert done == [True] * 12
+    assert stats["peak"] <= limit * TRANSFERS_PER_SLOT
+
+
+@pytest.mark.asyncio
+async def test_download_files_follows_raised_limit(slow_server, tmp_path):
+    base, stats = slow_server
+    concurrency = AdjustableConcurrency(1)
+    transfers = AdjustableConcurrency(TRANSFERS_PER_SLOT)
+    started = []
+    in_flight = peak_rows = 0
+
+    def on_start(name):
+        nonlocal in_flight, peak_rows
+        in_flight += 1
+        peak_rows = max(peak_rows, in_flight)
+        if len(started) == 2:
+            # Число потоков подняли во время загрузки
+            asyncio.ensure_future(concurrency.set_limit(4))
+            asyncio.ensure_future(transfers.set_limit(4 * TRANSFERS_PER_SLOT))
+        started.append(name)
+
+    def on_complete(name, ok, err):
+        nonlocal in_flight
+        in_flight -= 1
+
+    async with aiohttp.ClientSession() as session:
+        await download_files(
+            f"{base}/f_{{1..40}}.bin", str(tmp_path),
+            max_concurrent=1, session=session,
+            on_start=on_start, on_complete=on_complete,
+            concurrency=concurrency, transfers=transfers,
+        )
+    assert len(started) == 40
+    # Строки в GUI заводятся только для реально идущих загрузок
+    assert peak_rows <= 4 * TRANSFERS_PER_SLOT
+    assert stats["peak"] > TRANSFERS_PER_SLOT
+
+
+@pytest_asyncio.fixture
+async def range_server(serve):
+    """Сервер с поддержкой Range, отдающий DATA; в requests пишутся (метод, Range)"""
+    requests = []
+    return await serve({"/{name}": range_files(DATA, requests)}), requests
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("has_pwrite", [True, False])
+async def test_parallel_parts_need_pwrite(range_server, tmp_path, monkeypatch, has_pwrite):
+    monkeypatch.setattr(downloader, "PARALLEL_MIN_SIZE", 4096)
+    monkeypatch.setattr(downloader, "PARALLEL_MIN_PART", 1024)
+    if not has_pwrite:
+        monkeypatch.delattr(os, "pwrite")
+    base, requests = range_server
+    results = []
+    async with aiohttp.ClientSession() as session:
+        await download_files(
+            f"{base}/f_{{1..1}}.bin", str(tmp_path), max_concurrent=4, session=session,
+            on_complete=lambda name, ok, err: results.append((ok, err)),
+        )
+    assert results == [(True, "")]
+    assert (tmp_path / "f_1.bin").read_bytes() == DATA
+    assert sum(method == "GET" for method, _ in requests) == (4 if has_pwrite else 1)
+
+
+@pytest.mark.asyncio
+async def test_manager_reports_start_before_finish(range_server, tmp_path):
+    pytest.importorskip("PySide6")
+    from main import DownloadManager
+
+    events = []
+
+    class Signal:
+        def __init__(self, name):
+            self.name = name
+
+        def emit(self, *args):
+            events.append((self.name, *args))
+
+    signals = SimpleNamespace(
+        files_started=Signal("started"), file_progress=Signal("progress"),
+        file_finished=Signal("finished"),
+    )
+    manager = DownloadManager(signals)
+    base, _ = range_server
+    # Второй URL даёт то же имя файла: on_complete идёт сразу за on_start
+    async with aiohttp.ClientSession() as session:
+        await download_files(
+            f"{base}/{{1..2}}/data.csv", str(tmp_path), max_concurrent=2, session=session,
+            on_start=manager.on_file_start, on_progress=manager.on_file_progress,
+            on_complete=manager.on_file_complete,
+        )
+    await settle()
+    shown = set()
+    for name, *args in events:
+        if name == "started":
+            shown.update(args[0])
+        else:
+            assert args[0] in shown
+    assert ("finished", f"{base}/2/data.csv", False, "Имя файла совпадает с другим URL") in events
+
+
+async def fetch_one(base, out_dir, resume=True):
+    """Качает {base}/f_1.bin в out_dir одним потоком; возвращает [(ok, сообщение)]"""
+    results = []
+    async with aiohttp.ClientSession() as session:
+        await download_files(
+            f"{base}/f_{{1..1}}.bin", str(out_dir), max_concurrent=1, session=session,
+            resume=resume, on_complete=lambda name, ok, msg: results.append((ok, msg)),
+        )
+    return results
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("resume", [True, False])
+async def test_fresh_download_sends_no_head(range_server, tmp_path, resume):
+    base, requests = range_server
+    assert await fetch_one(base, tmp_path, resume) == [(True, "")]
+    assert requests == [("GET", None)]
+    assert [p.name for p in tmp_path.iterdir()] == ["f_1.bin"]
+
+
+@pytest.mark.asyncio
+async def test_finished_file_is_skipped(range_server, tmp_path):
+    base, requests = range_server
+    (tmp_path / "f_1.bin").write_bytes(DATA)
+    assert await fetch_one(base, tmp_path) == [(True, "Уже загружен")]
+    assert requests == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("meta, resumed", [
+    ("match", True),
+    (None, True),  # .part начат CLI
+    ("other_url", False),
+    ("other_size", False),
+    ("json", False),
+])
+async def test_resume_checks_meta(range_server, tmp_path, monkeypatch, meta, resumed):
+    base, requests = range_server
+    url = f"{base}/f_1.bin"
+    filepath = tmp_path / "f_1.bin"
+    downloader.get_part_path(filepath).write_bytes(DATA[:1000])
+    meta_path = downloader.get_meta_path(filepath)
+    contents = {
+        "match": format_meta(len(DATA), url),
+        "other_url": format_meta(len(DATA), f"{base}/other.bin"),
+        "other_size": format_meta(len(DATA) + 1, url),
+        "json": f'{{"server_size": {len(DATA)}, "url": "{url}"}}'.encode(),
+    }
+    if meta is not None:
+        meta_path.write_bytes(contents[meta])
+    writes = []
+    monkeypatch.setattr(downloader, "write_meta", lambda *args: writes.append(args))
+
+    assert await fetch_one(base, tmp_path) == [(True, "")]
+    assert requests == [("HEAD", None), ("GET", "bytes=1000-" if resumed else None)]
+    assert filepath.read_bytes() == DATA
+    assert not meta_path.exists()
+    # Совпадающий метафайл не перезаписывается
+    assert len(writes) == (0 if meta == "match" else 1)